@@ -0,0 +1,213 @@
+import copy
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+from threading import Event, Lock
+
+CacheKey = Tuple[str, str]
+
+# Maps a writing command to the cached read commands it affects and
+# the argument both use to address the same item on the PLC. An
+# argument of `None` drops every cached result of the read command.
+DEFAULT_INVALIDATIONS = {
+    'set_variable': (('get_variable', 'name'),),
+}
+
+
+class _Flight:
+    """Placeholder for a request that is in flight. The owner
+    starts the ticket after registering the flight, joiners wait
+    on `ready` until the ticket or the start error is set.
+    """
+    def __init__(self, generation: int, kwargs: Dict[str, Any]) -> None:
+        self.generation = generation
+        self.kwargs = kwargs
+        self.ready = Event()
+        self.ticket = None
+        self.error: Optional[BaseException] = None
+
+
+class CommandCache:
+    """Read-through cache for side-effect-free commands of a
+    `CommandServer`. Only commands in the allow-list are cached,
+    each with its own time to live. A time to live of 0 disables
+    storing for that command but still coalesces identical
+    requests. When the cache is full the least recently used
+    entry is evicted. Identical requests that are issued while
+    one of them is still running share the same ticket.
+
+    :param commands: Allow-list mapping command names to their
+        time to live in seconds
+    :type commands: Dict[str, float]
+    :param max_size: Maximum number of cached results. Defaults to 256
+    :type max_size: int, optional
+    :param invalidations: Maps writing commands to the
+        `(read_cmd, arg)` pairs they invalidate. The rules are
+        merged on top of `DEFAULT_INVALIDATIONS`, mapping a
+        default writer to an empty list disables its rules.
+        Defaults to None
+    :type invalidations: Dict[str, Iterable[Tuple[str, Optional[str]]]], optional
+    :raises ValueError: On a negative time to live, a `max_size`
+        below 1 or a writing command in the allow-list
+    """
+    def __init__(self, commands: Dict[str, float], max_size: int = 256,
+                 invalidations: Optional[
+                     Dict[str, Iterable[Tuple[str, Optional[str]]]]] = None
+                 ) -> None:
+        if max_size < 1:
+            raise ValueError('CommandCache - max_size must be at least 1')
+        for cmd, ttl in commands.items():
+            if ttl < 0:
+                raise ValueError(f'CommandCache - negative ttl for {cmd}')
+        invalidations = {**DEFAULT_INVALIDATIONS, **(invalidations or {})}
+        self._invalidations: Dict[str, Tuple[Tuple[str, Optional[str]], ...]] = {
+            cmd: tuple(rules) for cmd, rules in invalidations.items()
+        }
+        writers = set(commands) & set(self._invalidations)
+        if writers:
+            raise ValueError(
+                f'CommandCache - writing commands can not be cached: {sorted(writers)}'
+                )
+        self._ttls: Dict[str, float] = dict(commands)
+        self._max_size = max_size
+        self._entries: 'OrderedDict[CacheKey, Tuple[float, Dict[str, Any], Any]]' = \
+            OrderedDict()
+        self._in_flight: Dict[CacheKey, _Flight] = {}
+        self._generation = 0
+        self._lock = Lock()
+        self._hits = 0
+        self._misses = 0
+        self._coalesced = 0
+        self._evictions = 0
+
+    def is_cacheable(self, cmd: str) -> bool:
+        return cmd in self._ttls
+
+    def is_writer(self, cmd: str) -> bool:
+        return cmd in self._invalidations
+
+    @staticmethod
+    def make_key(cmd: str, kwargs: Dict[str, Any]) -> CacheKey:
+        return (cmd, json.dumps(kwargs, sort_keys=True))
+
+    def lookup(self, key: CacheKey) -> Tuple[bool, Any]:
+        """Returns `(True, result)` on a valid hit and counts it,
+        otherwise `(False, None)` without counting a miss.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            expires, _, result = entry
+            if expires <= time.monotonic():
+                del self._entries[key]
+                return False, None
+            self._entries.move_to_end(key)
+            self._hits += 1
+        return True, copy.deepcopy(result)
+
+    def join_or_start(self, key: CacheKey, kwargs: Dict[str, Any],
+                      start_fn: Callable[[], Any]) -> Tuple[Any, int, bool]:
+        """Returns the ticket in flight for `key` or starts a new
+        one with `start_fn`. Also returns the cache generation the
+        request was registered in and whether this caller started it.
+        `start_fn` is called without holding the cache lock.
+        """
+        with self._lock:
+            flight = self._in_flight.get(key)
+            if flight is not None:
+                self._coalesced += 1
+                owner = False
+            else:
+                self._misses += 1
+                flight = _Flight(self._generation, kwargs)
+                self._in_flight[key] = flight
+                owner = True
+
+        if not owner:
+            flight.ready.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.ticket, flight.generation, False
+
+        try:
+            flight.ticket = start_fn()
+        except BaseException as e:
+            flight.error = e
+            with self._lock:
+                if self._in_flight.get(key) is flight:
+                    del self._in_flight[key]
+            raise
+        finally:
+            flight.ready.set()
+        return flight.ticket, flight.generation, True
+
+    def complete(self, key: CacheKey, ticket: Any, generation: int,
+                 result: Optional[Any] = None, store: bool = False) -> None:
+        """Removes the finished ticket from the in-flight table and
+        stores its result, unless the cache was invalidated meanwhile.
+        Only the caller that started the ticket should call this.
+        """
+        with self._lock:
+            flight = self._in_flight.get(key)
+            if flight is not None and flight.ticket is ticket:
+                del self._in_flight[key]
+            else:
+                flight = None
+            if flight is None or not store or generation != self._generation:
+                return
+            ttl = self._ttls.get(key[0])
+            if not ttl:
+                return
+            self._entries[key] = (time.monotonic() + ttl, flight.kwargs,
+                                  copy.deepcopy(result))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def invalidate_for(self, cmd: str, kwargs: Dict[str, Any]) -> None:
+        """Drops every entry a call of `cmd` with `kwargs` may have
+        made stale according to the invalidation rules.
+        """
+        for read_cmd, arg in self._invalidations.get(cmd, ()):
+            if arg is not None and arg in kwargs:
+                self.invalidate(read_cmd, **{arg: kwargs[arg]})
+            else:
+                self.invalidate(read_cmd)
+
+    def invalidate(self, cmd: Optional[str] = None, **kwargs) -> None:
+        """Drops cached results. Without `cmd` everything is dropped,
+        with `cmd` only results of that command and if `kwargs` are
+        given only results of requests called with those argument
+        values, whatever their other arguments. Results of requests
+        in flight at this point are not stored.
+        """
+        def matches(key: CacheKey, args: Dict[str, Any]) -> bool:
+            return key[0] == cmd and all(
+                k in args and args[k] == v for k, v in kwargs.items()
+                )
+
+        with self._lock:
+            self._generation += 1
+            if cmd is None:
+                self._entries.clear()
+                self._in_flight.clear()
+                return
+            for key in [k for k, e in self._entries.items()
+                        if matches(k, e[1])]:
+                del self._entries[key]
+            for key in [k for k, f in self._in_flight.items()
+                        if matches(k, f.kwargs)]:
+                del self._in_flight[key]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'hits': self._hits,
+                'misses': self._misses,
+                'coalesced': self._coalesced,
+                'evictions': self._evictions,
+                'size': len(self._entries),
+            }
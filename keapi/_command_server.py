@@ -1,9 +1,11 @@
 from ._error import KebaError, HttpError, SocketError
 from ._auth_mgr import AuthMgr
+from ._cmd_cache import CommandCache
+import copy
 import json
 import websocket
 from enum import Enum
-from typing import Any
+from typing import Any, Dict, Iterable, Optional, Tuple
 from threading import Thread, Lock, Condition
 
 
@@ -135,6 +137,7 @@ class CommandServer:
         self._ticket_list = []
         self._lock = Lock()
         self._condition = Condition(self._lock)
+        self._cache = None
 
     def disconnect(self):
         """Disconnects from the socket.
@@ -175,7 +178,15 @@ class CommandServer:
             data['cmd'] = cmd
             if len(kwargs) > 0:
                 data['args'] = kwargs
-        self._ws.send(json.dumps(data))
+        cache = self._cache
+        if cache is not None and cache.is_writer(cmd):
+            cache.invalidate_for(cmd, kwargs)
+            self._ws.send(json.dumps(data))
+            # Reads registered before the write reached the socket
+            # may still return the old value and must not be stored.
+            cache.invalidate_for(cmd, kwargs)
+        else:
+            self._ws.send(json.dumps(data))
         return t
 
     def exec(self, cmd: str, **kwargs) -> Any:
@@ -184,13 +195,107 @@ class CommandServer:
         method is blocking. Returns the result of the
         executed command.
 
+        If the cache is enabled and `cmd` is in its allow-list
+        the result may be served from the cache or shared with
+        an identical request that is already running.
+
         :param cmd: PLC command
         :type cmd: str
         :return: Command result
         :rtype: Any
         """
-        t = self.start(cmd, **kwargs)
-        return t.wait()
+        cache = self._cache
+        if cache is None or not cache.is_cacheable(cmd):
+            t = self.start(cmd, **kwargs)
+            return t.wait()
+
+        key = cache.make_key(cmd, kwargs)
+        hit, result = cache.lookup(key)
+        if hit:
+            return result
+        t, generation, owner = cache.join_or_start(
+            key, kwargs, lambda: self.start(cmd, **kwargs)
+            )
+        if not owner:
+            return copy.deepcopy(t.wait())
+        try:
+            result = t.wait()
+        except BaseException:
+            cache.complete(key, t, generation)
+            raise
+        cache.complete(key, t, generation, result, store=True)
+        return result
+
+    def enable_cache(self, commands: Dict[str, float], max_size: int = 256,
+                     invalidations: Optional[
+                         Dict[str, Iterable[Tuple[str, Optional[str]]]]] = None):
+        """Enables the read-through cache for `exec`. Only
+        side-effect-free commands should be added to the
+        allow-list. A time to live of 0 only coalesces
+        identical requests without storing their result.
+        Writes via `set_variable` always invalidate the cached
+        `get_variable` results of the same variable unless
+        `invalidations` maps `set_variable` to an empty list.
+        Calling it again replaces the existing cache.
+
+        Example:
+
+        .. code-block:: python
+
+            cmdserver.enable_cache({'get_variable': 0.05}, max_size=512)
+
+            # set_tool additionally drops every cached get_tool result
+            cmdserver.enable_cache(
+                {'get_variable': 0.05, 'get_tool': 1.0},
+                invalidations={'set_tool': [('get_tool', None)]})
+
+        :param commands: Allow-list mapping command names to
+            their time to live in seconds
+        :type commands: Dict[str, float]
+        :param max_size: Maximum number of cached results,
+            the least recently used is evicted first. Defaults to 256
+        :type max_size: int, optional
+        :param invalidations: Maps writing commands to the
+            `(read_cmd, arg)` pairs whose cached results they drop.
+            With `arg` all results called with the same value of
+            that argument are dropped, with `None` all results of
+            `read_cmd`. The rules are merged on top of the default
+            `set_variable` rule. Defaults to None
+        :type invalidations: Dict[str, Iterable[Tuple[str, Optional[str]]]], optional
+        :raises ValueError: On a negative time to live, a
+            `max_size` below 1 or a writing command in `commands`
+        """
+        self._cache = CommandCache(commands, max_size, invalidations)
+
+    def disable_cache(self):
+        """Disables the cache and drops all cached results.
+        """
+        self._cache = None
+
+    def invalidate_cache(self, cmd: Optional[str] = None, **kwargs):
+        """Drops cached results. Without `cmd` the whole cache
+        is cleared. With `cmd` only results of that command are
+        dropped, or only the one matching `kwargs` if given.
+
+        :param cmd: PLC command, defaults to None
+        :type cmd: str, optional
+        """
+        cache = self._cache
+        if cache is not None:
+            cache.invalidate(cmd, **kwargs)
+
+    def cache_stats(self) -> Dict[str, int]:
+        """Returns the cache statistics `hits`, `misses`,
+        `coalesced`, `evictions` and `size`. Returns an empty
+        dict if the cache is disabled.
+
+        :return: Cache statistics
+        :rtype: Dict[str, int]
+        """
+        cache = self._cache
+        if cache is None:
+            return {}
+        return cache.stats()
 
     def _connect(self, auth_mgr: AuthMgr):
         url = (f"ws://{auth_mgr.host_ip()}/api/v4"
@@ -0,0 +1,243 @@
+import json
+import threading
+import time
+
+import pytest
+
+from keapi import CommandServer, get_variable, set_variable
+from keapi import _cmd_cache
+
+
+class StubWs:
+    """Records sent requests. Answers are delivered by the test
+    through `answer`, which routes them like the receiver thread.
+    """
+    def __init__(self, srv: CommandServer) -> None:
+        self.srv = srv
+        self.sent = []
+        self.sent_cond = threading.Condition()
+        self.before_send = None
+
+    def send(self, data: str):
+        if self.before_send is not None:
+            self.before_send(json.loads(data))
+        with self.sent_cond:
+            self.sent.append(json.loads(data))
+            self.sent_cond.notify_all()
+
+    def wait_sent(self, count: int):
+        with self.sent_cond:
+            assert self.sent_cond.wait_for(
+                lambda: len(self.sent) >= count, 5
+                )
+
+    def answer(self, index: int, result):
+        request = self.sent[index]['request']
+        ans = json.dumps({'response': request, 'status': 200,
+                          'result': result})
+        with self.srv._lock:
+            for t in self.srv._ticket_list:
+                if t._route_mux_locked(ans):
+                    self.srv._ticket_list.remove(t)
+                    break
+            self.srv._condition.notify_all()
+
+
+class AutoWs(StubWs):
+    """Answers every request immediately with `{'BOOL': <n>}`,
+    where n is the number of requests sent so far.
+    """
+    def send(self, data: str):
+        super().send(data)
+        self.answer(len(self.sent) - 1, {'BOOL': len(self.sent)})
+
+
+@pytest.fixture
+def srv():
+    s = CommandServer()
+    s._ws = AutoWs(s)
+    return s
+
+
+class FakeTime:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+def wait_until(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, 'wait_until - Timeout reached'
+        time.sleep(0.001)
+
+
+def run_threads(n, fn):
+    threads = [threading.Thread(target=fn) for _ in range(n)]
+    for t in threads:
+        t.start()
+    return threads
+
+
+def test_hit_miss_and_ttl(srv, monkeypatch):
+    clock = FakeTime()
+    monkeypatch.setattr(_cmd_cache, 'time', clock)
+    srv.enable_cache({'get_variable': 10})
+    a = srv.exec('get_variable', name='a')
+    assert srv.exec('get_variable', name='a') == a
+    assert len(srv._ws.sent) == 1
+    assert srv.cache_stats()['hits'] == 1
+    assert srv.cache_stats()['misses'] == 1
+    clock.now += 5
+    assert srv.exec('get_variable', name='a') == a
+    clock.now += 5
+    assert srv.exec('get_variable', name='a') != a
+    assert len(srv._ws.sent) == 2
+
+
+def test_uncached_command_bypasses_cache(srv):
+    srv.enable_cache({'get_variable': 10})
+    srv.exec('get_robot_info')
+    srv.exec('get_robot_info')
+    assert len(srv._ws.sent) == 2
+    assert srv.cache_stats()['misses'] == 0
+
+
+def test_hit_returns_copy(srv):
+    srv.enable_cache({'get_variable': 10})
+    srv.exec('get_variable', name='a')['BOOL'] = 'changed'
+    assert srv.exec('get_variable', name='a') == {'BOOL': 1}
+
+
+def test_lru_eviction(srv):
+    srv.enable_cache({'get_variable': 10}, max_size=2)
+    srv.exec('get_variable', name='a')
+    srv.exec('get_variable', name='b')
+    srv.exec('get_variable', name='a')
+    srv.exec('get_variable', name='c')
+    stats = srv.cache_stats()
+    assert stats['evictions'] == 1
+    assert stats['size'] == 2
+    srv.exec('get_variable', name='a')
+    assert len(srv._ws.sent) == 3
+    srv.exec('get_variable', name='b')
+    assert len(srv._ws.sent) == 4
+
+
+def test_invalid_config(srv):
+    with pytest.raises(ValueError):
+        srv.enable_cache({'get_variable': -1})
+    with pytest.raises(ValueError):
+        srv.enable_cache({'get_variable': 1}, max_size=0)
+    with pytest.raises(ValueError):
+        srv.enable_cache({'set_variable': 1})
+
+
+def test_coalescing():
+    srv = CommandServer()
+    srv._ws = StubWs(srv)
+    srv.enable_cache({'get_variable': 10})
+    results = []
+    threads = run_threads(
+        3, lambda: results.append(srv.exec('get_variable', name='a'))
+        )
+    srv._ws.wait_sent(1)
+    wait_until(lambda: srv.cache_stats()['coalesced'] >= 2)
+    srv._ws.answer(0, {'BOOL': True})
+    for t in threads:
+        t.join(5)
+    assert len(srv._ws.sent) == 1
+    assert results == [{'BOOL': True}] * 3
+    assert len({id(r) for r in results}) == 3
+    assert srv.cache_stats()['coalesced'] == 2
+
+
+def test_set_variable_invalidates(srv):
+    srv.enable_cache({'get_variable': 10})
+    srv.exec('get_variable', name='a')
+    srv.exec('get_variable', name='b')
+    srv.exec('set_variable', name='a', value={'BOOL': False})
+    srv.exec('get_variable', name='a')
+    srv.exec('get_variable', name='b')
+    assert [r['cmd'] for r in srv._ws.sent] == [
+        'get_variable', 'get_variable', 'set_variable', 'get_variable'
+        ]
+
+
+def test_invalidation_ignores_extra_arguments(srv):
+    srv.enable_cache({'get_tool': 10},
+                     invalidations={'set_tool': [('get_tool', 'name')]})
+    srv.exec('get_tool', name='t0', frame='world')
+    srv.exec('get_tool', name='t1', frame='world')
+    srv.exec('set_tool', name='t0', value=1)
+    srv.exec('get_tool', name='t0', frame='world')
+    srv.exec('get_tool', name='t1', frame='world')
+    assert [r['cmd'] for r in srv._ws.sent] == [
+        'get_tool', 'get_tool', 'set_tool', 'get_tool'
+        ]
+
+
+def test_custom_invalidations_keep_defaults(srv):
+    srv.enable_cache({'get_variable': 10, 'get_tool': 10},
+                     invalidations={'set_tool': [('get_tool', None)]})
+    get_variable(srv, 'P', 'a')
+    set_variable(srv, 'P', 'a', False)
+    srv.exec('get_variable', name='P.a')
+    assert [r['cmd'] for r in srv._ws.sent] == [
+        'get_variable', 'set_variable', 'get_variable'
+        ]
+
+
+def test_custom_invalidations(srv):
+    srv.enable_cache({'get_tool': 10},
+                     invalidations={'set_tool': [('get_tool', None)]})
+    srv.exec('get_tool', name='t0')
+    srv.exec('set_tool', name='t1')
+    srv.exec('get_tool', name='t0')
+    assert len(srv._ws.sent) == 3
+
+
+def test_write_racing_in_flight_read():
+    srv = CommandServer()
+    srv._ws = StubWs(srv)
+    srv.enable_cache({'get_variable': 10})
+    read = run_threads(1, lambda: srv.exec('get_variable', name='a'))[0]
+    srv._ws.wait_sent(1)
+    write = srv.start('set_variable', name='a', value={'BOOL': False})
+    srv._ws.answer(0, {'BOOL': True})
+    srv._ws.answer(1, None)
+    read.join(5)
+    write.wait(5)
+    assert srv.cache_stats()['size'] == 0
+    reread = run_threads(1, lambda: srv.exec('get_variable', name='a'))[0]
+    srv._ws.wait_sent(3)
+    srv._ws.answer(2, {'BOOL': False})
+    reread.join(5)
+    assert srv.exec('get_variable', name='a') == {'BOOL': False}
+
+
+def test_read_sent_before_write_is_not_stored():
+    srv = CommandServer()
+    srv._ws = StubWs(srv)
+    srv.enable_cache({'get_variable': 10})
+    results = []
+
+    def read_before_write(data):
+        if data['cmd'] != 'set_variable':
+            return
+        srv._ws.before_send = None
+        read = run_threads(
+            1, lambda: results.append(srv.exec('get_variable', name='a'))
+            )[0]
+        srv._ws.wait_sent(1)
+        srv._ws.answer(0, {'BOOL': True})
+        read.join(5)
+
+    srv._ws.before_send = read_before_write
+    write = srv.start('set_variable', name='a', value={'BOOL': False})
+    srv._ws.answer(1, None)
+    write.wait(5)
+    assert results == [{'BOOL': True}]
+    assert srv.cache_stats()['size'] == 0